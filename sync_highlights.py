@@ -13,22 +13,70 @@ import re
 import hashlib
 import json
 import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
+from operator import attrgetter
 from pathlib import Path
 from datetime import datetime
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
 
 # === CONFIGURATION ===
 
-STATE_FILE = Path.home() / ".kindle-sync-state.json"
+STATE_FILE = Path.home() / ".kindle-sync-state.bin"
+LEGACY_STATE_FILE = Path.home() / ".kindle-sync-state.json"  # Read once to migrate
 LOG_FILE = Path.home() / ".kindle-sync.log"
+VOLUMES_DIR = Path("/Volumes")  # Where macOS mounts the Kindle
 DEVONTHINK_GROUP = "Kindle Highlights"  # Group name in DEVONthink
+MAX_WORKERS = 8  # Books written in parallel
+ID_FORMAT = "blake2b"  # Hash used for highlight ids in the state file
+ID_BYTES = 6  # Highlight ids are this many bytes, i.e. 12 hex characters
+STATE_MAGIC = b"KSB1"  # Header of the binary state file
+
+
+# === PATTERNS ===
+
+_META_RE = re.compile(
+    r'(?P<page>page\s+(?P<page_num>\d+))'
+    r'|(?P<loc>location\s+(?P<loc_start>\d+)(?:-(?P<loc_end>\d+))?)'
+    # The date is captured in a lookahead so the scan continues past it
+    r'|(?P<date>Added on\s+(?=(?P<date_str>.+)$))'
+    r'|(?P<note>(?-i:Your Note|Your Bookmark))',
+    re.IGNORECASE
+)
+
+# Kindle date formats, split by whether the string leads with a weekday
+_WEEKDAY_DATE_FORMATS = (
+    "%A, %d %B %Y %H:%M:%S",
+    "%A, %B %d, %Y %H:%M:%S",
+    "%A, %B %d, %Y, %H:%M:%S",
+    "%A %d %B %Y %H:%M:%S",
+)
+_NUMERIC_DATE_FORMATS = (
+    "%d %B %Y %H:%M:%S",
+)
+_MONTHS = {
+    'january': 1, 'february': 2, 'march': 3, 'april': 4,
+    'may': 5, 'june': 6, 'july': 7, 'august': 8,
+    'september': 9, 'october': 10, 'november': 11, 'december': 12,
+}
+_WEEKDAYS = frozenset([
+    'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
+])
+_UNSAFE_FILENAME_RE = re.compile(r'[<>:"/\\|?*]')
 
 
 # === DATA STRUCTURES ===
 
-@dataclass
+# dataclass(slots=True) needs Python 3.10+; macOS still ships 3.9
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_SLOTS)
 class Highlight:
     """A single highlight or note from a book."""
     text: str
@@ -38,74 +86,83 @@ class Highlight:
     date_added: Optional[datetime] = None
     is_note: bool = False
     highlight_id: str = ""
+    sort_key: tuple = field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
         content = f"{self.text}{self.page}{self.location_start}"
-        self.highlight_id = hashlib.md5(content.encode()).hexdigest()[:12]
-
-    @property
-    def sort_key(self):
-        return (
+        self.highlight_id = hashlib.blake2b(content.encode(), digest_size=ID_BYTES).hexdigest()
+        self.sort_key = (
             self.page if self.page is not None else 999999,
             self.location_start if self.location_start is not None else 999999,
             self.date_added or datetime.min
         )
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class Book:
     """A book with its highlights."""
     title: str
     author: str = "Unknown"
     highlights: list = field(default_factory=list)
+    safe_filename: str = field(init=False, repr=False, compare=False)
 
-    @property
-    def safe_filename(self) -> str:
-        title = re.sub(r'[<>:"/\\|?*]', '', self.title)
-        author = re.sub(r'[<>:"/\\|?*]', '', self.author)
+    def __post_init__(self):
+        # Computed once here; cached_property can't be used with slots
+        sub = _UNSAFE_FILENAME_RE.sub
+        title = sub('', self.title)
+        author = sub('', self.author)
         if author and author != "Unknown":
-            return f"{title} — {author}"
-        return title
+            self.safe_filename = f"{title} — {author}"
+        else:
+            self.safe_filename = title
 
 
 # === PARSING ===
 
-def parse_clippings(clippings_path: Path) -> dict[str, Book]:
-    """Parse My Clippings.txt and return a dictionary of books."""
+_ENTRY_SEPARATOR = '=========='
+
+
+def _iter_entries(clippings_path: Path) -> Iterator[tuple[str, str, str]]:
+    """Yield (title line, metadata line, text) for each clippings entry.
+
+    The file is read one line at a time; the third line of an entry is the
+    blank line before the text. Entries with fewer than three lines are skipped.
+    """
+    lines = []
+    with open(clippings_path, encoding='utf-8-sig') as f:
+        # A trailing separator flushes the last entry
+        for line in chain(f, (_ENTRY_SEPARATOR,)):
+            if line.strip() == _ENTRY_SEPARATOR:
+                if len(lines) >= 3:
+                    yield lines[0].strip(), lines[1].strip(), ''.join(lines[3:]).strip()
+                lines = []
+            elif lines or line.strip():
+                # Skip blank lines before the title
+                lines.append(line)
+
+
+def parse_clippings(clippings_path: Path) -> dict[tuple[str, str], Book]:
+    """Parse My Clippings.txt and return books keyed by (title, author)."""
     books = {}
 
     if not clippings_path.exists():
         logging.error(f"Clippings file not found: {clippings_path}")
         return books
 
-    content = clippings_path.read_text(encoding='utf-8-sig')
-    entries = content.split('==========')
-
-    for entry in entries:
-        entry = entry.strip()
-        if not entry:
-            continue
-
-        lines = entry.split('\n')
-        if len(lines) < 3:
-            continue
-
-        title_line = lines[0].strip()
+    for title_line, meta_line, text in _iter_entries(clippings_path):
         title, author = parse_title_author(title_line)
 
-        meta_line = lines[1].strip()
         highlight_meta = parse_metadata(meta_line)
 
         if highlight_meta is None:
             continue
 
-        text = '\n'.join(lines[3:]).strip()
         if not text:
             continue
 
-        book_key = f"{title}|{author}"
-        if book_key not in books:
-            books[book_key] = Book(title=title, author=author)
+        book = books.get(key := (title, author))
+        if book is None:
+            book = books[key] = Book(title=title, author=author)
 
         highlight = Highlight(
             text=text,
@@ -116,15 +173,21 @@ def parse_clippings(clippings_path: Path) -> dict[str, Book]:
             is_note=highlight_meta.get('is_note', False)
         )
 
-        books[book_key].highlights.append(highlight)
+        book.highlights.append(highlight)
 
     return books
 
 
 def parse_title_author(line: str) -> tuple[str, str]:
-    match = re.match(r'^(.+?)\s*\(([^)]+)\)\s*$', line)
-    if match:
-        return match.group(1).strip(), match.group(2).strip()
+    # Author is the trailing "(...)" group; the last ')' closes it and the
+    # earliest '(' after the previous ')' opens it
+    stripped = line.rstrip()
+    if stripped.endswith(')'):
+        close = len(stripped) - 1
+        start = max(stripped.rfind(')', 0, close) + 1, 1)
+        idx = stripped.find('(', start, close)
+        if idx != -1 and idx + 1 < close:
+            return stripped[:idx].strip(), stripped[idx + 1:close].strip()
     return line.strip(), "Unknown"
 
 
@@ -140,33 +203,69 @@ def parse_metadata(line: str) -> Optional[dict]:
         'is_note': False
     }
 
-    result['is_note'] = 'Your Note' in line or 'Your Bookmark' in line
+    # One pass over the line; only the first match of each kind counts
+    date_seen = False
+    for match in _META_RE.finditer(line):
+        kind = match.lastgroup
+        if kind == 'page':
+            if result['page'] is None:
+                result['page'] = int(match.group('page_num'))
+        elif kind == 'loc':
+            if result['location_start'] is None:
+                result['location_start'] = int(match.group('loc_start'))
+                if match.group('loc_end'):
+                    result['location_end'] = int(match.group('loc_end'))
+        elif kind == 'date':
+            if not date_seen:
+                date_seen = True
+                result['date'] = parse_date(match.group('date_str').strip())
+        else:
+            result['is_note'] = True
 
-    page_match = re.search(r'page\s+(\d+)', line, re.IGNORECASE)
-    if page_match:
-        result['page'] = int(page_match.group(1))
+    return result
 
-    loc_match = re.search(r'location\s+(\d+)(?:-(\d+))?', line, re.IGNORECASE)
-    if loc_match:
-        result['location_start'] = int(loc_match.group(1))
-        if loc_match.group(2):
-            result['location_end'] = int(loc_match.group(2))
 
-    date_match = re.search(r'Added on\s+(.+)$', line, re.IGNORECASE)
-    if date_match:
-        result['date'] = parse_date(date_match.group(1).strip())
+def _parse_date_fast(date_str: str) -> datetime:
+    """Parse the known Kindle date layouts without going through strptime.
 
-    return result
+    Raises KeyError or ValueError if the string doesn't fit.
+    """
+    parts = date_str.replace(',', '').split()
+    if len(parts) == 5:
+        if parts[0].lower() not in _WEEKDAYS:
+            raise ValueError(date_str)
+        parts = parts[1:]
+    if len(parts) != 4:
+        raise ValueError(date_str)
+
+    first, second, year, time = parts
+    if first.isdigit():
+        day, month = first, second
+    else:
+        month, day = first, second
+    hour, minute, sec = time.split(':')
+
+    # int() alone would also take '+9', '1_0' or '0012', which strptime rejects
+    small = (day, hour, minute, sec)
+    if len(year) != 4 or any(len(n) > 2 for n in small):
+        raise ValueError(date_str)
+    if not all(n.isascii() and n.isdigit() for n in (year, *small)):
+        raise ValueError(date_str)
+    return datetime(int(year), _MONTHS[month.lower()], int(day), int(hour), int(minute), int(sec))
 
 
+@lru_cache(maxsize=None)
 def parse_date(date_str: str) -> Optional[datetime]:
-    formats = [
-        "%A, %d %B %Y %H:%M:%S",
-        "%A, %B %d, %Y %H:%M:%S",
-        "%A, %B %d, %Y, %H:%M:%S",
-        "%A %d %B %Y %H:%M:%S",
-        "%d %B %Y %H:%M:%S",
-    ]
+    # Highlights from one reading session share timestamps, so this is cached
+    try:
+        return _parse_date_fast(date_str)
+    except (KeyError, ValueError):
+        pass
+
+    if date_str[:1].isdigit():
+        formats = _NUMERIC_DATE_FORMATS
+    else:
+        formats = _WEEKDAY_DATE_FORMATS
     for fmt in formats:
         try:
             return datetime.strptime(date_str, fmt)
@@ -175,32 +274,78 @@ def parse_date(date_str: str) -> Optional[datetime]:
     return None
 
 
+@lru_cache(maxsize=None)
+def format_date(date: datetime) -> str:
+    # strftime is locale-aware and slow; timestamps repeat, as in parse_date
+    return date.strftime("%A, %d %B %Y %H:%M:%S")
+
+
 # === STATE MANAGEMENT ===
 
 def load_state() -> dict:
+    """Load imported ids from the binary state file.
+
+    The file is STATE_MAGIC followed by the sorted ids packed as raw
+    ID_BYTES-byte values. Falls back to the older JSON state file.
+    """
     if STATE_FILE.exists():
+        data = STATE_FILE.read_bytes()
+        header = len(STATE_MAGIC)
+        if data[:header] == STATE_MAGIC and (len(data) - header) % ID_BYTES == 0:
+            imported_ids = [
+                data[i:i + ID_BYTES].hex() for i in range(header, len(data), ID_BYTES)
+            ]
+            return {"id_format": ID_FORMAT, "imported_ids": imported_ids}
+        logging.warning(f"Corrupt state file: {STATE_FILE}")
+
+    if LEGACY_STATE_FILE.exists():
         try:
-            return json.loads(STATE_FILE.read_text())
+            return json.loads(LEGACY_STATE_FILE.read_bytes())
         except json.JSONDecodeError:
-            logging.warning("Corrupt state file, starting fresh")
-    return {"imported_ids": []}
+            logging.warning(f"Corrupt state file: {LEGACY_STATE_FILE}")
+
+    if STATE_FILE.exists() or LEGACY_STATE_FILE.exists():
+        logging.warning("No usable state file, starting fresh")
+    return {"id_format": ID_FORMAT, "imported_ids": []}
+
+
+def save_state(imported: set):
+    packed = b''.join(bytes.fromhex(i) for i in sorted(imported))
+    STATE_FILE.write_bytes(STATE_MAGIC + packed)
 
 
-def save_state(state: dict):
-    STATE_FILE.write_text(json.dumps(state, indent=2))
+def migrate_legacy_ids(books: dict[tuple[str, str], Book], imported: set) -> int:
+    """Map ids from older state files (truncated MD5) onto current ids.
+
+    Matched MD5 ids are replaced, so they aren't carried in the state forever.
+    """
+    matched = set()
+    for book in books.values():
+        for highlight in book.highlights:
+            content = f"{highlight.text}{highlight.page}{highlight.location_start}"
+            legacy_id = hashlib.md5(content.encode()).hexdigest()[:12]
+            if legacy_id in imported:
+                imported.add(highlight.highlight_id)
+                matched.add(legacy_id)
+    imported.difference_update(matched)
+    return len(matched)
 
 
 # === DEVONTHINK INTEGRATION ===
 
-def import_to_devonthink(name: str, content: str, output_dir: Path) -> bool:
-    """Write a Markdown document to the output folder for DEVONthink to index."""
+def import_to_devonthink(name: str, lines: Iterable[str], output_dir: Path) -> bool:
+    """Write a Markdown document to the output folder for DEVONthink to index.
+
+    `name` must already be filesystem-safe (see Book.safe_filename).
+    `lines` is written out as it is produced rather than joined first.
+    """
 
     output_dir.mkdir(parents=True, exist_ok=True)
-    safe_filename = re.sub(r'[<>:"/\\|?*]', '', name) + '.md'
-    filepath = output_dir / safe_filename
+    filepath = output_dir / f"{name}.md"
 
     try:
-        filepath.write_text(content, encoding='utf-8')
+        with open(filepath, 'w', encoding='utf-8', buffering=1 << 16) as f:
+            f.writelines(lines)
         return True
     except Exception as e:
         logging.error(f"Error writing file: {e}")
@@ -209,70 +354,65 @@ def import_to_devonthink(name: str, content: str, output_dir: Path) -> bool:
 
 # === MARKDOWN GENERATION ===
 
-def generate_markdown(book: Book, existing_ids: set) -> tuple[str, list[str]]:
-    sorted_highlights = sorted(book.highlights, key=lambda h: h.sort_key)
-    new_highlights = [h for h in sorted_highlights if h.highlight_id not in existing_ids]
-
-    if not new_highlights and existing_ids:
-        return None, []
-
-    lines = [
-        f"# {book.title}",
-        f"## By {book.author}",
-        "",
-        "---",
-        "### Highlights",
-        "",
-    ]
-
-    for highlight in sorted_highlights:
-        # Build the highlight text
-        if highlight.is_note:
-            lines.append(f"*[Note]* {highlight.text}")
+def _render(highlight: Highlight) -> str:
+    """Build the Markdown block for one highlight, ending in a newline."""
+    # Build metadata line with colors
+    meta_parts = []
+    if highlight.page:
+        meta_parts.append(f'<font color="#d97706"><b>Page {highlight.page}</b></font>')
+    if highlight.location_start:
+        if highlight.location_end and highlight.location_end != highlight.location_start:
+            meta_parts.append(f'<font color="#2563eb"><b>Loc {highlight.location_start}-{highlight.location_end}</b></font>')
         else:
-            lines.append(f'"{highlight.text}"')
-        lines.append("")
-
-        # Build metadata line with colors
-        meta_parts = []
-        if highlight.page:
-            meta_parts.append(f'<font color="#d97706"><b>Page {highlight.page}</b></font>')
-        if highlight.location_start:
-            if highlight.location_end and highlight.location_end != highlight.location_start:
-                meta_parts.append(f'<font color="#2563eb"><b>Loc {highlight.location_start}-{highlight.location_end}</b></font>')
-            else:
-                meta_parts.append(f'<font color="#2563eb"><b>Loc {highlight.location_start}</b></font>')
-        if highlight.date_added:
-            date_str = highlight.date_added.strftime("%A, %d %B %Y %H:%M:%S")
-            meta_parts.append(f'<font color="#059669">{date_str}</font>')
-
-        if meta_parts:
-            lines.append(f'<p><small>{" &bull; ".join(meta_parts)}</small></p>')
-        lines.append("")
-        lines.append("---")
-        lines.append("")
-
-    new_ids = [h.highlight_id for h in new_highlights]
-    return '\n'.join(lines), new_ids
-
-
-def process_book(book: Book, state: dict, output_dir: Path) -> int:
-    """Generate markdown and write to output folder."""
-    existing_ids = set(state.get("imported_ids", []))
-
-    markdown, new_ids = generate_markdown(book, existing_ids)
-
-    if markdown is None:
+            meta_parts.append(f'<font color="#2563eb"><b>Loc {highlight.location_start}</b></font>')
+    if highlight.date_added:
+        meta_parts.append(f'<font color="#059669">{format_date(highlight.date_added)}</font>')
+    meta = f'<p><small>{" &bull; ".join(meta_parts)}</small></p>\n' if meta_parts else ""
+
+    if highlight.is_note:
+        return f"*[Note]* {highlight.text}\n\n{meta}\n---\n"
+    return f'"{highlight.text}"\n\n{meta}\n---\n'
+
+
+def generate_markdown_lines(book: Book) -> Iterator[str]:
+    """Yield the Markdown document for a book, one block at a time."""
+    yield f"# {book.title}\n## By {book.author}\n\n---\n### Highlights\n"
+
+    # Each block ends in a newline and is separated by a blank line
+    for highlight in sorted(book.highlights, key=attrgetter('sort_key')):
+        yield "\n"
+        yield _render(highlight)
+
+
+def process_book(book: Book, imported: set, output_dir: Path) -> list[str]:
+    """Generate markdown and write to output folder.
+
+    Returns the ids of the newly saved highlights. `imported` is only read,
+    so books can be processed in parallel.
+    """
+    new_ids = [h.highlight_id for h in book.highlights if h.highlight_id not in imported]
+
+    if not new_ids and imported:
         logging.info(f"No new highlights for: {book.title}")
-        return 0
+        return []
 
-    if import_to_devonthink(book.safe_filename, markdown, output_dir):
-        state["imported_ids"].extend(new_ids)
+    if import_to_devonthink(book.safe_filename, generate_markdown_lines(book), output_dir):
         logging.info(f"Saved: {book.safe_filename} (+{len(new_ids)} highlights)")
-        return len(new_ids)
+        return new_ids
     else:
         logging.error(f"Failed to save: {book.safe_filename}")
-        return 0
+        return []
+
+
+def process_books(books: list[Book], imported: set, output_dir: Path) -> list[str]:
+    """Process books one after another, returning all newly saved ids.
+
+    Used for books that share an output file, so their writes never overlap.
+    """
+    new_ids = []
+    for book in books:
+        new_ids.extend(process_book(book, imported, output_dir))
+    return new_ids
 
 
 # === MAIN ===
@@ -290,14 +430,19 @@ def setup_logging():
 
 def find_clippings() -> Optional[Path]:
     """Find My Clippings.txt on mounted Kindle."""
-    for name in ["Kindle", "KINDLE", "kindle"]:
-        kindle = Path(f"/Volumes/{name}")
-        if kindle.exists():
-            for loc in ["documents/My Clippings.txt", "My Clippings.txt"]:
-                clippings = kindle / loc
-                if clippings.exists():
-                    logging.info(f"Found Kindle at: {kindle}")
-                    return clippings
+    # One directory listing instead of probing each spelling of the volume
+    try:
+        with os.scandir(VOLUMES_DIR) as volumes:
+            kindles = [Path(v.path) for v in volumes if v.name.lower() == "kindle"]
+    except OSError:
+        kindles = []
+
+    for kindle in kindles:
+        for loc in ("documents/My Clippings.txt", "My Clippings.txt"):
+            clippings = kindle / loc
+            if clippings.exists():
+                logging.info(f"Found Kindle at: {kindle}")
+                return clippings
 
     logging.error("Kindle not found or My Clippings.txt missing")
     return None
@@ -313,18 +458,36 @@ def main():
         return 1
 
     state = load_state()
-    logging.info(f"Loaded state: {len(state.get('imported_ids', []))} highlights already imported")
+    imported = set(state.get("imported_ids", []))
+    logging.info(f"Loaded state: {len(imported)} highlights already imported")
 
     books = parse_clippings(clippings_path)
     logging.info(f"Found {len(books)} books with highlights")
 
+    if imported and state.get("id_format") != ID_FORMAT:
+        migrated = migrate_legacy_ids(books, imported)
+        logging.info(f"Migrated {migrated} highlight ids from older state file")
+
     output_dir = Path.home() / "Documents" / "Kindle Highlights"
 
-    total_new = 0
+    # Books whose file names collide (ignoring case, as macOS does) go to one
+    # task so they are written in order and the last one replaces the file
+    by_filename = {}
     for book in books.values():
-        total_new += process_book(book, state, output_dir)
+        by_filename.setdefault(book.safe_filename.casefold(), []).append(book)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(
+            lambda group: process_books(group, imported, output_dir), by_filename.values()
+        ))
+
+    # Count what the set grew by; the same highlight can appear in two books
+    already_imported = len(imported)
+    for new_ids in results:
+        imported.update(new_ids)
+    total_new = len(imported) - already_imported
 
-    save_state(state)
+    save_state(imported)
     logging.info(f"Sync complete: {total_new} new highlights saved to {output_dir}")
     logging.info("=" * 50)
 